@@ -0,0 +1,87 @@
+"""
+Agent Request Batcher
+Coalesces concurrent downstream requests into bulk endpoint calls
+"""
+
+import aiohttp
+import asyncio
+import logging
+import orjson
+from typing import Any, Dict, List, Optional, Tuple
+
+from shared_http import get_http_session, orjson_default, JSON_HEADERS
+
+logger = logging.getLogger(__name__)
+
+class AgentBatcher:
+    """Batches concurrent payloads bound for one downstream endpoint.
+
+    Payloads submitted within the debounce window are flushed as a single
+    POST of {"batch": [...]} to the endpoint's bulk variant, and the
+    per-index entries of the returned {"results": [...]} are fanned back
+    to the awaiting callers. A batch is flushed early once it reaches
+    max_batch_size.
+    """
+
+    def __init__(self, endpoint: str, max_batch_size: int = 32,
+                 window: float = 0.015, timeout: float = 30.0):
+        self.endpoint = endpoint
+        self.max_batch_size = max_batch_size
+        self.window = window
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self._pending: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def submit(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Queue a payload and wait for its slice of the batched response"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((payload, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_task is None:
+            self._flush_task = loop.create_task(self._flush_after_window())
+
+        return await future
+
+    async def _flush_after_window(self):
+        await asyncio.sleep(self.window)
+        self._flush()
+
+    def _flush(self):
+        """Dispatch everything pending as one bulk request"""
+        batch, self._pending = self._pending, []
+        task, self._flush_task = self._flush_task, None
+        if task is not None and task is not asyncio.current_task() and not task.done():
+            task.cancel()
+        if batch:
+            asyncio.ensure_future(self._send(batch))
+
+    async def _send(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]):
+        payloads = [payload for payload, _ in batch]
+        try:
+            session = get_http_session()
+            async with session.post(
+                f"{self.endpoint}/batch",
+                data=orjson.dumps({"batch": payloads}, default=orjson_default),
+                headers=JSON_HEADERS,
+                timeout=self.timeout
+            ) as response:
+                results = orjson.loads(await response.read()).get("results", [])
+
+            for i, (_, future) in enumerate(batch):
+                if future.done():
+                    continue
+                if i < len(results):
+                    future.set_result(results[i])
+                else:
+                    future.set_exception(RuntimeError(
+                        f"Missing batched result at index {i} from {self.endpoint}"
+                    ))
+
+        except Exception as e:
+            logger.error("Batched request to %s failed: %s", self.endpoint, e)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
@@ -4,27 +4,47 @@ Central Python service that coordinates all medical AI agents
 """
 
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Dict, List, Optional, Any
+from contextlib import asynccontextmanager
+from types import MappingProxyType
+import aiohttp
 import asyncio
-import httpx
-import json
+import orjson
+import os
+import time
 from datetime import datetime
 import logging
-from langgraph import StateGraph, END
-from langchain_core.messages import HumanMessage, AIMessage
-from medical_agents import MedicalAgentOrchestrator
+from medical_agents import MedicalAgentOrchestrator, JAVA_MEDICAL_BASE
 from model_gateway import ModelGateway
+from shared_http import get_http_session, close_http_session, JSON_HEADERS
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+try:
+    from cpp_client import CppMedicalClient
+except ImportError:
+    CppMedicalClient = None
+
+# Configure logging; set LOG_LEVEL=WARNING in production to keep the
+# per-request hot path free of logging-lock contention
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"))
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Medical AI Agent Orchestrator", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open the shared HTTP session at startup, close it at shutdown
+    get_http_session()
+    yield
+    await model_gateway.aclose()
+    await close_http_session()
+
+app = FastAPI(title="Medical AI Agent Orchestrator", version="1.0.0",
+              lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # Initialize components
 agent_orchestrator = MedicalAgentOrchestrator()
 model_gateway = ModelGateway()
+cpp_client = CppMedicalClient() if CppMedicalClient is not None else None
 
 class PatientData(BaseModel):
     patient_id: str
@@ -61,33 +81,36 @@ async def analyze_patient(request: MedicalAnalysisRequest):
     Main endpoint for comprehensive medical AI analysis
     """
     try:
+        # One monotonic sample for elapsed time, one wall-clock sample for
+        # the analysis ID and response timestamp
+        start_perf = time.perf_counter()
         start_time = datetime.now()
-        
+
         # Generate unique analysis ID
         analysis_id = f"analysis_{request.patient_data.patient_id}_{int(start_time.timestamp())}"
         
-        logger.info(f"Starting medical analysis {analysis_id}")
-        
+        logger.info("Starting medical analysis %s", analysis_id)
+
+        # Dump the Pydantic model once and freeze it so agents running
+        # concurrent workflows cannot mutate shared patient data
+        patient_dict = MappingProxyType(request.patient_data.model_dump(mode="python"))
+
         # Route to appropriate analysis workflow
         if request.analysis_type == "complete":
             results = await agent_orchestrator.run_complete_analysis(
-                request.patient_data.dict(),
+                patient_dict,
                 priority=request.priority,
                 requested_models=request.requested_models
             )
         elif request.analysis_type == "diagnosis_only":
-            results = await agent_orchestrator.run_diagnosis_analysis(
-                request.patient_data.dict()
-            )
+            results = await agent_orchestrator.run_diagnosis_analysis(patient_dict)
         elif request.analysis_type == "treatment_only":
-            results = await agent_orchestrator.run_treatment_analysis(
-                request.patient_data.dict()
-            )
+            results = await agent_orchestrator.run_treatment_analysis(patient_dict)
         else:
             raise HTTPException(status_code=400, detail="Invalid analysis type")
         
-        processing_time = (datetime.now() - start_time).total_seconds()
-        
+        processing_time = time.perf_counter() - start_perf
+
         return MedicalAnalysisResponse(
             analysis_id=analysis_id,
             patient_id=request.patient_data.patient_id,
@@ -96,26 +119,27 @@ async def analyze_patient(request: MedicalAnalysisRequest):
             confidence_score=results.get("overall_confidence", 0.85),
             processing_time=processing_time,
             models_used=results.get("models_used", []),
-            timestamp=datetime.now()
+            timestamp=start_time
         )
         
     except Exception as e:
-        logger.error(f"Analysis failed: {str(e)}")
+        logger.error("Analysis failed: %s", e)
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
 @app.post("/agents/java/forward")
 async def forward_to_java_service(data: Dict[str, Any]):
     """Forward requests to Java medical services"""
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "http://localhost:8080/api/medical/analyze",
-                json=data,
-                timeout=30.0
-            )
-            return response.json()
+        session = get_http_session()
+        async with session.post(
+            f"{JAVA_MEDICAL_BASE}/analyze",
+            data=orjson.dumps(data),
+            headers=JSON_HEADERS,
+            timeout=aiohttp.ClientTimeout(total=30)
+        ) as response:
+            return orjson.loads(await response.read())
     except Exception as e:
-        logger.error(f"Java service communication failed: {str(e)}")
+        logger.error("Java service communication failed: %s", e)
         raise HTTPException(status_code=503, detail="Java service unavailable")
 
 @app.post("/agents/cpp/forward")
@@ -123,27 +147,28 @@ async def forward_to_cpp_service(data: Dict[str, Any]):
     """Forward requests to C++ performance-critical services"""
     try:
         # Use gRPC for C++ communication
-        from cpp_client import CppMedicalClient
-        cpp_client = CppMedicalClient()
+        if cpp_client is None:
+            raise RuntimeError("C++ client unavailable")
         result = await cpp_client.analyze_imaging(data)
         return result
     except Exception as e:
-        logger.error(f"C++ service communication failed: {str(e)}")
+        logger.error("C++ service communication failed: %s", e)
         raise HTTPException(status_code=503, detail="C++ service unavailable")
 
 @app.post("/agents/js/forward")
 async def forward_to_js_service(data: Dict[str, Any]):
     """Forward requests to JavaScript/Node.js services"""
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "http://localhost:3000/api/medical/analyze",
-                json=data,
-                timeout=30.0
-            )
-            return response.json()
+        session = get_http_session()
+        async with session.post(
+            "http://localhost:3000/api/medical/analyze",
+            data=orjson.dumps(data),
+            headers=JSON_HEADERS,
+            timeout=aiohttp.ClientTimeout(total=30)
+        ) as response:
+            return orjson.loads(await response.read())
     except Exception as e:
-        logger.error(f"JavaScript service communication failed: {str(e)}")
+        logger.error("JavaScript service communication failed: %s", e)
         raise HTTPException(status_code=503, detail="JavaScript service unavailable")
 
 @app.get("/models/available")
@@ -156,38 +181,100 @@ async def route_to_best_model(task: str, data: Dict[str, Any]):
     """Route request to the best model for the task"""
     return await model_gateway.route_request(task, data)
 
+@app.post("/models/route/stream")
+async def stream_from_best_model(task: str, data: Dict[str, Any]):
+    """Stream the best model's response as it is generated"""
+    return StreamingResponse(
+        model_gateway.route_request_stream(task, data),
+        media_type="text/plain"
+    )
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
+    # The four probes are independent, so run them concurrently
+    java_health, cpp_health, js_health, models_health = await asyncio.gather(
+        check_service_health("http://localhost:8080/health"),
+        check_cpp_service_health(),
+        check_service_health("http://localhost:3000/health"),
+        check_models_health(),
+        return_exceptions=True
+    )
+
     return {
         "status": "healthy",
         "timestamp": datetime.now(),
         "services": {
-            "java": await check_service_health("http://localhost:8080/health"),
-            "cpp": await check_cpp_service_health(),
-            "javascript": await check_service_health("http://localhost:3000/health"),
-            "models": await model_gateway.health_check()
+            "java": java_health is True,
+            "cpp": cpp_health is True,
+            "javascript": js_health is True,
+            "models": models_health if isinstance(models_health, dict) else {}
         }
     }
 
+# Short-lived probe cache so load-balancer health checks do not generate
+# sustained downstream traffic
+HEALTH_CACHE_TTL = 2.0
+_health_cache: Dict[str, Any] = {}
+
+def _cached_health(key: str) -> Optional[Any]:
+    entry = _health_cache.get(key)
+    if entry is not None and time.monotonic() - entry[1] < HEALTH_CACHE_TTL:
+        return entry[0]
+    return None
+
+def _store_health(key: str, result: Any) -> Any:
+    _health_cache[key] = (result, time.monotonic())
+    return result
+
 async def check_service_health(url: str) -> bool:
     """Check if a service is healthy"""
+    cached = _cached_health(url)
+    if cached is not None:
+        return cached
+    try:
+        session = get_http_session()
+        async with session.get(url, timeout=aiohttp.ClientTimeout(total=5)) as response:
+            return _store_health(url, response.status == 200)
+    except Exception:
+        return _store_health(url, False)
+
+async def check_models_health() -> Dict[str, Any]:
+    """Check model backend health via the gateway.
+
+    The most expensive probe of the four — it issues real model requests,
+    including billable API completions — so the TTL cache matters most here.
+    """
+    cached = _cached_health("models")
+    if cached is not None:
+        return cached
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, timeout=5.0)
-            return response.status_code == 200
-    except:
-        return False
+        return _store_health("models", await model_gateway.health_check())
+    except Exception:
+        return _store_health("models", {})
 
 async def check_cpp_service_health() -> bool:
     """Check C++ service health via gRPC"""
+    cached = _cached_health("cpp")
+    if cached is not None:
+        return cached
     try:
-        from cpp_client import CppMedicalClient
-        cpp_client = CppMedicalClient()
-        return await cpp_client.health_check()
-    except:
-        return False
+        if cpp_client is None:
+            return _store_health("cpp", False)
+        return _store_health("cpp", await cpp_client.health_check())
+    except Exception:
+        return _store_health("cpp", False)
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # uvloop + httptools and 2n+1 workers; orchestrator and gateway are
+    # re-initialized per worker on import, so no state crosses processes
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        workers=(os.cpu_count() or 1) * 2 + 1,
+        log_level="warning"
+    )
\ No newline at end of file
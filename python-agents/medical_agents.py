@@ -1,385 +1,462 @@
-"""
-Medical Agent Orchestrator using LangGraph
-Coordinates multiple specialized medical AI agents
-"""
-
-from langgraph import StateGraph, END
-from langchain_core.messages import HumanMessage, AIMessage
-from typing import Dict, List, Any, Optional
-import asyncio
-import json
-from datetime import datetime
-import logging
-from dataclasses import dataclass
-from enum import Enum
-
-logger = logging.getLogger(__name__)
-
-class Priority(Enum):
-    URGENT = "urgent"
-    NORMAL = "normal" 
-    ROUTINE = "routine"
-
-@dataclass
-class MedicalState:
-    patient_data: Dict[str, Any]
-    intake_results: Optional[Dict[str, Any]] = None
-    exam_results: Optional[Dict[str, Any]] = None
-    lab_results: Optional[Dict[str, Any]] = None
-    imaging_results: Optional[Dict[str, Any]] = None
-    diagnosis_results: Optional[Dict[str, Any]] = None
-    treatment_results: Optional[Dict[str, Any]] = None
-    prescription_results: Optional[Dict[str, Any]] = None
-    overall_confidence: float = 0.0
-    models_used: List[str] = None
-    priority: Priority = Priority.NORMAL
-    
-    def __post_init__(self):
-        if self.models_used is None:
-            self.models_used = []
-
-class MedicalAgentOrchestrator:
-    def __init__(self):
-        self.workflow = self._build_workflow()
-        
-    def _build_workflow(self) -> StateGraph:
-        """Build the medical analysis workflow using LangGraph"""
-        workflow = StateGraph(MedicalState)
-        
-        # Add nodes for each medical analysis step
-        workflow.add_node("patient_intake", self._patient_intake_agent)
-        workflow.add_node("physical_exam", self._physical_exam_agent)
-        workflow.add_node("lab_analysis", self._lab_analysis_agent)
-        workflow.add_node("imaging_analysis", self._imaging_analysis_agent)
-        workflow.add_node("diagnosis_reasoning", self._diagnosis_reasoning_agent)
-        workflow.add_node("treatment_planning", self._treatment_planning_agent)
-        workflow.add_node("prescription_generation", self._prescription_agent)
-        workflow.add_node("quality_assurance", self._quality_assurance_agent)
-        
-        # Define workflow edges
-        workflow.set_entry_point("patient_intake")
-        workflow.add_edge("patient_intake", "physical_exam")
-        workflow.add_edge("physical_exam", "lab_analysis")
-        workflow.add_edge("lab_analysis", "imaging_analysis")
-        workflow.add_edge("imaging_analysis", "diagnosis_reasoning")
-        workflow.add_edge("diagnosis_reasoning", "treatment_planning")
-        workflow.add_edge("treatment_planning", "prescription_generation")
-        workflow.add_edge("prescription_generation", "quality_assurance")
-        workflow.add_edge("quality_assurance", END)
-        
-        return workflow.compile()
-    
-    async def run_complete_analysis(self, patient_data: Dict[str, Any], 
-                                  priority: str = "normal",
-                                  requested_models: Optional[List[str]] = None) -> Dict[str, Any]:
-        """Run complete medical analysis workflow"""
-        
-        initial_state = MedicalState(
-            patient_data=patient_data,
-            priority=Priority(priority),
-            models_used=requested_models or []
-        )
-        
-        try:
-            # Execute the workflow
-            final_state = await self.workflow.ainvoke(initial_state)
-            
-            # Compile results
-            results = {
-                "patient_intake": final_state.intake_results,
-                "physical_exam": final_state.exam_results,
-                "lab_analysis": final_state.lab_results,
-                "imaging_analysis": final_state.imaging_results,
-                "diagnosis": final_state.diagnosis_results,
-                "treatment_plan": final_state.treatment_results,
-                "prescriptions": final_state.prescription_results,
-                "overall_confidence": final_state.overall_confidence,
-                "models_used": final_state.models_used,
-                "analysis_complete": True,
-                "timestamp": datetime.now().isoformat()
-            }
-            
-            return results
-            
-        except Exception as e:
-            logger.error(f"Workflow execution failed: {str(e)}")
-            return {
-                "error": str(e),
-                "analysis_complete": False,
-                "timestamp": datetime.now().isoformat()
-            }
-    
-    async def _patient_intake_agent(self, state: MedicalState) -> MedicalState:     
-   """Patient intake and history collection agent"""
-        try:
-            from model_gateway import ModelGateway
-            model_gateway = ModelGateway()
-            
-            # Route to best model for medical intake
-            intake_prompt = f"""
-            Analyze patient intake data and generate comprehensive medical history assessment:
-            
-            Patient: {state.patient_data.get('name', 'Unknown')}
-            Age: {state.patient_data.get('age', 'Unknown')}
-            Gender: {state.patient_data.get('gender', 'Unknown')}
-            Symptoms: {', '.join(state.patient_data.get('symptoms', []))}
-            Medical History: {', '.join(state.patient_data.get('medical_history', []))}
-            Allergies: {', '.join(state.patient_data.get('allergies', []))}
-            Current Medications: {', '.join(state.patient_data.get('current_medications', []))}
-            
-            Provide:
-            1. Risk stratification (LOW/MODERATE/HIGH)
-            2. Key clinical concerns
-            3. Recommended follow-up questions
-            4. Urgency assessment
-            """
-            
-            result = await model_gateway.route_request("medical_intake", {
-                "prompt": intake_prompt,
-                "patient_data": state.patient_data
-            })
-            
-            state.intake_results = result
-            state.models_used.append(result.get("model_used", "unknown"))
-            
-            logger.info("Patient intake analysis completed")
-            return state
-            
-        except Exception as e:
-            logger.error(f"Patient intake agent failed: {str(e)}")
-            state.intake_results = {"error": str(e)}
-            return state
-    
-    async def _physical_exam_agent(self, state: MedicalState) -> MedicalState:
-        """Physical examination analysis agent"""
-        try:
-            # Forward to Java service for physical exam analysis
-            import httpx
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    "http://localhost:8080/api/medical/physical-exam",
-                    json=state.patient_data,
-                    timeout=30.0
-                )
-                state.exam_results = response.json()
-            
-            logger.info("Physical exam analysis completed")
-            return state
-            
-        except Exception as e:
-            logger.error(f"Physical exam agent failed: {str(e)}")
-            state.exam_results = {"error": str(e)}
-            return state
-    
-    async def _lab_analysis_agent(self, state: MedicalState) -> MedicalState:
-        """Laboratory results analysis agent"""
-        try:
-            # Forward to Java service for lab analysis
-            import httpx
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    "http://localhost:8080/api/medical/lab-analysis",
-                    json=state.patient_data,
-                    timeout=30.0
-                )
-                state.lab_results = response.json()
-            
-            logger.info("Lab analysis completed")
-            return state
-            
-        except Exception as e:
-            logger.error(f"Lab analysis agent failed: {str(e)}")
-            state.lab_results = {"error": str(e)}
-            return state
-    
-    async def _imaging_analysis_agent(self, state: MedicalState) -> MedicalState:
-        """Medical imaging analysis agent - uses C++ for performance"""
-        try:
-            # Forward to C++ service for high-performance imaging analysis
-            from cpp_client import CppMedicalClient
-            cpp_client = CppMedicalClient()
-            
-            imaging_data = {
-                "patient_id": state.patient_data.get("patient_id"),
-                "imaging_results": state.patient_data.get("imaging_results"),
-                "symptoms": state.patient_data.get("symptoms", [])
-            }
-            
-            result = await cpp_client.analyze_imaging(imaging_data)
-            state.imaging_results = result
-            state.models_used.append("cpp_imaging_model")
-            
-            logger.info("Imaging analysis completed")
-            return state
-            
-        except Exception as e:
-            logger.error(f"Imaging analysis agent failed: {str(e)}")
-            state.imaging_results = {"error": str(e)}
-            return state
-    
-    async def _diagnosis_reasoning_agent(self, state: MedicalState) -> MedicalState:
-        """Differential diagnosis reasoning agent"""
-        try:
-            # Forward to Java service for diagnosis reasoning
-            import httpx
-            
-            diagnosis_data = {
-                "patient_data": state.patient_data,
-                "intake_results": state.intake_results,
-                "exam_results": state.exam_results,
-                "lab_results": state.lab_results,
-                "imaging_results": state.imaging_results
-            }
-            
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    "http://localhost:8080/api/medical/diagnosis",
-                    json=diagnosis_data,
-                    timeout=30.0
-                )
-                state.diagnosis_results = response.json()
-            
-            logger.info("Diagnosis reasoning completed")
-            return state
-            
-        except Exception as e:
-            logger.error(f"Diagnosis reasoning agent failed: {str(e)}")
-            state.diagnosis_results = {"error": str(e)}
-            return state
-    
-    async def _treatment_planning_agent(self, state: MedicalState) -> MedicalState:
-        """Treatment planning agent"""
-        try:
-            # Forward to Java service for treatment planning
-            import httpx
-            
-            treatment_data = {
-                "patient_data": state.patient_data,
-                "diagnosis_results": state.diagnosis_results
-            }
-            
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    "http://localhost:8080/api/medical/treatment",
-                    json=treatment_data,
-                    timeout=30.0
-                )
-                state.treatment_results = response.json()
-            
-            logger.info("Treatment planning completed")
-            return state
-            
-        except Exception as e:
-            logger.error(f"Treatment planning agent failed: {str(e)}")
-            state.treatment_results = {"error": str(e)}
-            return state
-    
-    async def _prescription_agent(self, state: MedicalState) -> MedicalState:
-        """Prescription generation agent"""
-        try:
-            # Forward to Java service for prescription generation
-            import httpx
-            
-            prescription_data = {
-                "patient_data": state.patient_data,
-                "treatment_results": state.treatment_results
-            }
-            
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    "http://localhost:8080/api/medical/prescriptions",
-                    json=prescription_data,
-                    timeout=30.0
-                )
-                state.prescription_results = response.json()
-            
-            logger.info("Prescription generation completed")
-            return state
-            
-        except Exception as e:
-            logger.error(f"Prescription agent failed: {str(e)}")
-            state.prescription_results = {"error": str(e)}
-            return state
-    
-    async def _quality_assurance_agent(self, state: MedicalState) -> MedicalState:
-        """Quality assurance and validation agent"""
-        try:
-            from model_gateway import ModelGateway
-            model_gateway = ModelGateway()
-            
-            # Comprehensive QA analysis
-            qa_prompt = f"""
-            Review the complete medical analysis for quality assurance:
-            
-            Patient: {state.patient_data.get('name')}
-            Diagnosis: {state.diagnosis_results}
-            Treatment: {state.treatment_results}
-            Prescriptions: {state.prescription_results}
-            
-            Validate:
-            1. Clinical consistency
-            2. Drug interactions and contraindications
-            3. Age-appropriate treatments
-            4. Missing critical assessments
-            5. Overall confidence score (0-1)
-            
-            Provide quality score and recommendations.
-            """
-            
-            qa_result = await model_gateway.route_request("medical_qa", {
-                "prompt": qa_prompt,
-                "analysis_data": {
-                    "intake": state.intake_results,
-                    "diagnosis": state.diagnosis_results,
-                    "treatment": state.treatment_results,
-                    "prescriptions": state.prescription_results
-                }
-            })
-            
-            # Calculate overall confidence
-            confidence_scores = []
-            for result in [state.intake_results, state.exam_results, state.lab_results, 
-                          state.imaging_results, state.diagnosis_results, state.treatment_results]:
-                if result and isinstance(result, dict) and "confidence" in result:
-                    confidence_scores.append(result["confidence"])
-            
-            state.overall_confidence = sum(confidence_scores) / len(confidence_scores) if confidence_scores else 0.85
-            state.models_used.append(qa_result.get("model_used", "qa_model"))
-            
-            logger.info("Quality assurance completed")
-            return state
-            
-        except Exception as e:
-            logger.error(f"Quality assurance agent failed: {str(e)}")
-            state.overall_confidence = 0.75  # Default confidence
-            return state
-    
-    async def run_diagnosis_analysis(self, patient_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Run diagnosis-only analysis"""
-        # Simplified workflow for diagnosis only
-        state = MedicalState(patient_data=patient_data)
-        
-        state = await self._patient_intake_agent(state)
-        state = await self._diagnosis_reasoning_agent(state)
-        
-        return {
-            "patient_intake": state.intake_results,
-            "diagnosis": state.diagnosis_results,
-            "confidence": state.overall_confidence,
-            "models_used": state.models_used
-        }
-    
-    async def run_treatment_analysis(self, patient_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Run treatment-only analysis"""
-        # Simplified workflow for treatment only
-        state = MedicalState(patient_data=patient_data)
-        
-        state = await self._treatment_planning_agent(state)
-        state = await self._prescription_agent(state)
-        
-        return {
-            "treatment_plan": state.treatment_results,
-            "prescriptions": state.prescription_results,
-            "confidence": state.overall_confidence,
-            "models_used": state.models_used
-        }
\ No newline at end of file
+"""
+Medical Agent Orchestrator using LangGraph
+Coordinates multiple specialized medical AI agents
+"""
+
+from langgraph import StateGraph, END
+from langchain_core.messages import HumanMessage, AIMessage
+from typing import Dict, List, Any, Optional, Annotated, TypedDict
+import asyncio
+import hashlib
+import json
+import operator
+from collections import OrderedDict
+from datetime import datetime
+import logging
+from enum import Enum
+from agent_batcher import AgentBatcher
+from model_gateway import ModelGateway
+
+try:
+    from cpp_client import CppMedicalClient
+except ImportError:
+    CppMedicalClient = None
+
+logger = logging.getLogger(__name__)
+
+# Single Java origin: every medical RPC below reuses the shared aiohttp
+# session's keepalive pool (up to 50 connections to this host)
+JAVA_MEDICAL_BASE = "http://localhost:8080/api/medical"
+
+# Java endpoints that support bulk {"batch": [...]} requests.
+# diagnose_treat_prescribe accepts the aggregated state once and returns
+# {diagnosis, treatment, prescriptions} in a single response
+JAVA_BATCH_ENDPOINTS = (
+    "physical-exam",
+    "lab-analysis",
+    "diagnose_treat_prescribe",
+)
+
+class Priority(Enum):
+    URGENT = "urgent"
+    NORMAL = "normal"
+    ROUTINE = "routine"
+
+class MedicalState(TypedDict, total=False):
+    patient_data: Dict[str, Any]
+    intake_results: Optional[Dict[str, Any]]
+    exam_results: Optional[Dict[str, Any]]
+    lab_results: Optional[Dict[str, Any]]
+    imaging_results: Optional[Dict[str, Any]]
+    diagnosis_results: Optional[Dict[str, Any]]
+    treatment_results: Optional[Dict[str, Any]]
+    prescription_results: Optional[Dict[str, Any]]
+    overall_confidence: float
+    # Running-mean accumulators: each node folds its result's confidence
+    # in as it completes, so QA divides once instead of re-scanning
+    confidence_sum: Annotated[float, operator.add]
+    confidence_count: Annotated[int, operator.add]
+    # operator.add merges appends from concurrently running nodes
+    models_used: Annotated[List[str], operator.add]
+    priority: Priority
+
+INTAKE_PROMPT_TEMPLATE = """
+Analyze patient intake data and generate comprehensive medical history assessment:
+
+Patient: {name}
+Age: {age}
+Gender: {gender}
+Symptoms: {symptoms}
+Medical History: {medical_history}
+Allergies: {allergies}
+Current Medications: {current_medications}
+
+Provide:
+1. Risk stratification (LOW/MODERATE/HIGH)
+2. Key clinical concerns
+3. Recommended follow-up questions
+4. Urgency assessment
+"""
+
+QA_PROMPT_TEMPLATE = """
+Review the complete medical analysis for quality assurance:
+
+Patient: {name}
+Diagnosis: {diagnosis}
+Treatment: {treatment}
+Prescriptions: {prescriptions}
+
+Validate:
+1. Clinical consistency
+2. Drug interactions and contraindications
+3. Age-appropriate treatments
+4. Missing critical assessments
+5. Overall confidence score (0-1)
+
+Provide quality score and recommendations.
+"""
+
+class _PatientPromptView:
+    """format_map view over patient_data that joins list fields lazily,
+    so only fields a template references are ever formatted"""
+
+    _LIST_FIELDS = frozenset(
+        ("symptoms", "medical_history", "allergies", "current_medications")
+    )
+
+    def __init__(self, patient_data: Dict[str, Any]):
+        self._patient_data = patient_data
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._LIST_FIELDS:
+            return ', '.join(self._patient_data.get(key) or [])
+        value = self._patient_data.get(key)
+        return value if value is not None else 'Unknown'
+
+def _add_confidence(delta: Dict[str, Any], result: Any) -> Dict[str, Any]:
+    """Fold a result's confidence score into the running-mean accumulators"""
+    if isinstance(result, dict) and "confidence" in result:
+        delta["confidence_sum"] = delta.get("confidence_sum", 0.0) + result["confidence"]
+        delta["confidence_count"] = delta.get("confidence_count", 0) + 1
+    return delta
+
+class MedicalAgentOrchestrator:
+    # Maximum number of memoized workflow results kept in memory
+    ANALYSIS_CACHE_SIZE = 256
+
+    def __init__(self):
+        self.model_gateway = ModelGateway()
+        self.cpp_client = CppMedicalClient() if CppMedicalClient is not None else None
+        self.workflow = self._build_workflow()
+        # Memoized workflow results keyed by (analysis_type, patient hash)
+        self._analysis_cache: OrderedDict = OrderedDict()
+        # One batcher per Java endpoint coalesces concurrent patient requests
+        self._batchers = {
+            name: AgentBatcher(f"{JAVA_MEDICAL_BASE}/{name}")
+            for name in JAVA_BATCH_ENDPOINTS
+        }
+
+    @staticmethod
+    def _patient_hash(patient_data: Dict[str, Any]) -> str:
+        """Stable hash of a patient_data payload for memoization"""
+        canonical = json.dumps(dict(patient_data), sort_keys=True, default=str)
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def _cache_get(self, key) -> Optional[Dict[str, Any]]:
+        """Look up a memoized analysis result, refreshing its LRU position"""
+        cached = self._analysis_cache.get(key)
+        if cached is not None:
+            self._analysis_cache.move_to_end(key)
+        return cached
+
+    @staticmethod
+    def _has_error(results: Dict[str, Any]) -> bool:
+        """True if the result or any sub-result carries an error marker"""
+        return "error" in results or any(
+            isinstance(v, dict) and "error" in v for v in results.values()
+        )
+
+    def _cache_put(self, key, results: Dict[str, Any]):
+        """Memoize an analysis result, evicting the least recently used entry.
+
+        Failed results are never memoized: the cache has no TTL, so a
+        transient backend outage would otherwise keep serving the stale
+        failure long after the backend recovered.
+        """
+        if self._has_error(results):
+            return
+        self._analysis_cache[key] = results
+        if len(self._analysis_cache) > self.ANALYSIS_CACHE_SIZE:
+            self._analysis_cache.popitem(last=False)
+
+    def _build_workflow(self) -> StateGraph:
+        """Build the medical analysis workflow using LangGraph"""
+        workflow = StateGraph(MedicalState)
+
+        # Add nodes for each medical analysis step
+        workflow.add_node("patient_intake", self._patient_intake_agent)
+        workflow.add_node("physical_exam", self._physical_exam_agent)
+        workflow.add_node("lab_analysis", self._lab_analysis_agent)
+        workflow.add_node("imaging_analysis", self._imaging_analysis_agent)
+        workflow.add_node("diagnosis_bundle", self._diagnosis_bundle_agent)
+        workflow.add_node("quality_assurance", self._quality_assurance_agent)
+
+        # Define workflow edges
+        # Exam, lab and imaging only depend on patient_data, so fan them out
+        # in parallel after intake and fan back in at the diagnosis bundle,
+        # which covers diagnosis, treatment and prescriptions in one call
+        workflow.set_entry_point("patient_intake")
+        workflow.add_edge("patient_intake", "physical_exam")
+        workflow.add_edge("patient_intake", "lab_analysis")
+        workflow.add_edge("patient_intake", "imaging_analysis")
+        workflow.add_edge(["physical_exam", "lab_analysis", "imaging_analysis"],
+                          "diagnosis_bundle")
+        workflow.add_edge("diagnosis_bundle", "quality_assurance")
+        workflow.add_edge("quality_assurance", END)
+
+        return workflow.compile()
+
+    async def run_complete_analysis(self, patient_data: Dict[str, Any],
+                                  priority: str = "normal",
+                                  requested_models: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Run complete medical analysis workflow"""
+
+        cache_key = ("complete", priority, tuple(requested_models or []),
+                     self._patient_hash(patient_data))
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            logger.debug("Analysis cache hit for complete workflow")
+            return cached
+
+        initial_state: MedicalState = {
+            "patient_data": patient_data,
+            "priority": Priority(priority),
+            "models_used": requested_models or [],
+            "overall_confidence": 0.0,
+            "confidence_sum": 0.0,
+            "confidence_count": 0
+        }
+
+        try:
+            # Execute the workflow
+            final_state = await self.workflow.ainvoke(initial_state)
+
+            # Compile results
+            results = {
+                "patient_intake": final_state.get("intake_results"),
+                "physical_exam": final_state.get("exam_results"),
+                "lab_analysis": final_state.get("lab_results"),
+                "imaging_analysis": final_state.get("imaging_results"),
+                "diagnosis": final_state.get("diagnosis_results"),
+                "treatment_plan": final_state.get("treatment_results"),
+                "prescriptions": final_state.get("prescription_results"),
+                "overall_confidence": final_state.get("overall_confidence", 0.0),
+                "models_used": final_state.get("models_used", []),
+                "analysis_complete": True,
+                "timestamp": datetime.now().isoformat()
+            }
+
+            self._cache_put(cache_key, results)
+            return results
+
+        except Exception as e:
+            logger.error("Workflow execution failed: %s", e)
+            return {
+                "error": str(e),
+                "analysis_complete": False,
+                "timestamp": datetime.now().isoformat()
+            }
+
+    async def _patient_intake_agent(self, state: MedicalState) -> Dict[str, Any]:
+        """Patient intake and history collection agent"""
+        try:
+            patient_data = state["patient_data"]
+
+            # Route to best model for medical intake
+            intake_prompt = INTAKE_PROMPT_TEMPLATE.format_map(
+                _PatientPromptView(patient_data)
+            )
+
+            result = await self.model_gateway.route_request("medical_intake", {
+                "prompt": intake_prompt,
+                "patient_data": patient_data
+            })
+
+            logger.debug("Patient intake analysis completed")
+            return _add_confidence({
+                "intake_results": result,
+                "models_used": [result.get("model_used", "unknown")]
+            }, result)
+
+        except Exception as e:
+            logger.error("Patient intake agent failed: %s", e)
+            return {"intake_results": {"error": str(e)}}
+
+    async def _physical_exam_agent(self, state: MedicalState) -> Dict[str, Any]:
+        """Physical examination analysis agent"""
+        try:
+            # Forward to Java service for physical exam analysis
+            exam_results = await self._batchers["physical-exam"].submit(
+                state["patient_data"]
+            )
+
+            logger.debug("Physical exam analysis completed")
+            return _add_confidence({"exam_results": exam_results}, exam_results)
+
+        except Exception as e:
+            logger.error("Physical exam agent failed: %s", e)
+            return {"exam_results": {"error": str(e)}}
+
+    async def _lab_analysis_agent(self, state: MedicalState) -> Dict[str, Any]:
+        """Laboratory results analysis agent"""
+        # Fast path: nothing to analyze, skip the Java round-trip
+        patient_data = state["patient_data"]
+        if not patient_data.get("lab_results") and not patient_data.get("vital_signs"):
+            return {"lab_results": {"status": "skipped", "reason": "no_lab_data"}}
+
+        try:
+            # Forward to Java service for lab analysis
+            lab_results = await self._batchers["lab-analysis"].submit(patient_data)
+
+            logger.debug("Lab analysis completed")
+            return _add_confidence({"lab_results": lab_results}, lab_results)
+
+        except Exception as e:
+            logger.error("Lab analysis agent failed: %s", e)
+            return {"lab_results": {"error": str(e)}}
+
+    async def _imaging_analysis_agent(self, state: MedicalState) -> Dict[str, Any]:
+        """Medical imaging analysis agent - uses C++ for performance"""
+        # Fast path: no imaging data, skip the C++ gRPC round-trip
+        if not state["patient_data"].get("imaging_results"):
+            return {"imaging_results": {"status": "skipped", "reason": "no_imaging"}}
+
+        try:
+            # Forward to C++ service for high-performance imaging analysis
+            if self.cpp_client is None:
+                raise RuntimeError("C++ imaging client unavailable")
+
+            patient_data = state["patient_data"]
+            imaging_data = {
+                "patient_id": patient_data.get("patient_id"),
+                "imaging_results": patient_data.get("imaging_results"),
+                "symptoms": patient_data.get("symptoms", [])
+            }
+
+            result = await self.cpp_client.analyze_imaging(imaging_data)
+
+            logger.debug("Imaging analysis completed")
+            return _add_confidence({
+                "imaging_results": result,
+                "models_used": ["cpp_imaging_model"]
+            }, result)
+
+        except Exception as e:
+            logger.error("Imaging analysis agent failed: %s", e)
+            return {"imaging_results": {"error": str(e)}}
+
+    async def _diagnosis_bundle_agent(self, state: MedicalState) -> Dict[str, Any]:
+        """Diagnosis, treatment and prescription agent - one Java call.
+
+        Sends the aggregated state once instead of re-serializing
+        patient_data for three sequential endpoints.
+        """
+        try:
+            bundle_data = {
+                "patient_data": state["patient_data"],
+                "intake_results": state.get("intake_results"),
+                "exam_results": state.get("exam_results"),
+                "lab_results": state.get("lab_results"),
+                "imaging_results": state.get("imaging_results")
+            }
+
+            bundle = await self._batchers["diagnose_treat_prescribe"].submit(bundle_data)
+
+            delta = {
+                "diagnosis_results": bundle.get("diagnosis"),
+                "treatment_results": bundle.get("treatment"),
+                "prescription_results": bundle.get("prescriptions")
+            }
+            _add_confidence(delta, delta["diagnosis_results"])
+            _add_confidence(delta, delta["treatment_results"])
+
+            logger.debug("Diagnosis bundle completed")
+            return delta
+
+        except Exception as e:
+            logger.error("Diagnosis bundle agent failed: %s", e)
+            error = {"error": str(e)}
+            return {
+                "diagnosis_results": error,
+                "treatment_results": error,
+                "prescription_results": error
+            }
+
+    async def _quality_assurance_agent(self, state: MedicalState) -> Dict[str, Any]:
+        """Quality assurance and validation agent"""
+        try:
+            # Comprehensive QA analysis
+            qa_prompt = QA_PROMPT_TEMPLATE.format_map({
+                "name": state["patient_data"].get('name'),
+                "diagnosis": state.get("diagnosis_results"),
+                "treatment": state.get("treatment_results"),
+                "prescriptions": state.get("prescription_results")
+            })
+
+            qa_result = await self.model_gateway.route_request("medical_qa", {
+                "prompt": qa_prompt,
+                "analysis_data": {
+                    "intake": state.get("intake_results"),
+                    "diagnosis": state.get("diagnosis_results"),
+                    "treatment": state.get("treatment_results"),
+                    "prescriptions": state.get("prescription_results")
+                }
+            })
+
+            # Overall confidence is the running mean the agents accumulated
+            confidence_count = state.get("confidence_count", 0)
+            overall_confidence = (state.get("confidence_sum", 0.0) / confidence_count
+                                  if confidence_count else 0.85)
+
+            logger.debug("Quality assurance completed")
+            return {
+                "overall_confidence": overall_confidence,
+                "models_used": [qa_result.get("model_used", "qa_model")]
+            }
+
+        except Exception as e:
+            logger.error("Quality assurance agent failed: %s", e)
+            return {"overall_confidence": 0.75}  # Default confidence
+
+    async def run_diagnosis_analysis(self, patient_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Run diagnosis-only analysis"""
+        cache_key = ("diagnosis_only", self._patient_hash(patient_data))
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            logger.debug("Analysis cache hit for diagnosis workflow")
+            return cached
+
+        # Simplified workflow for diagnosis only
+        state: MedicalState = {
+            "patient_data": patient_data,
+            "models_used": [],
+            "overall_confidence": 0.0
+        }
+
+        state.update(await self._patient_intake_agent(state))
+        state.update(await self._diagnosis_bundle_agent(state))
+
+        results = {
+            "patient_intake": state.get("intake_results"),
+            "diagnosis": state.get("diagnosis_results"),
+            "confidence": state.get("overall_confidence", 0.0),
+            "models_used": state.get("models_used", [])
+        }
+        self._cache_put(cache_key, results)
+        return results
+
+    async def run_treatment_analysis(self, patient_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Run treatment-only analysis"""
+        cache_key = ("treatment_only", self._patient_hash(patient_data))
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            logger.debug("Analysis cache hit for treatment workflow")
+            return cached
+
+        # Simplified workflow for treatment only
+        state: MedicalState = {
+            "patient_data": patient_data,
+            "models_used": [],
+            "overall_confidence": 0.0
+        }
+
+        state.update(await self._diagnosis_bundle_agent(state))
+
+        results = {
+            "treatment_plan": state.get("treatment_results"),
+            "prescriptions": state.get("prescription_results"),
+            "confidence": state.get("overall_confidence", 0.0),
+            "models_used": state.get("models_used", [])
+        }
+        self._cache_put(cache_key, results)
+        return results
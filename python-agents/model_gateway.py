@@ -1,371 +1,760 @@
-"""
-Multi-Model Gateway
-Routes requests to the best AI model based on task type and requirements
-"""
-
-import asyncio
-import httpx
-import json
-from typing import Dict, List, Any, Optional
-import logging
-from dataclasses import dataclass
-from enum import Enum
-import time
-
-logger = logging.getLogger(__name__)
-
-class ModelType(Enum):
-    MEDICAL_REASONING = "medical_reasoning"
-    CODE_GENERATION = "code_generation"
-    GENERAL_REASONING = "general_reasoning"
-    MEDICAL_QA = "medical_qa"
-    MEDICAL_INTAKE = "medical_intake"
-
-@dataclass
-class ModelConfig:
-    name: str
-    endpoint: str
-    model_type: ModelType
-    max_tokens: int
-    temperature: float
-    cost_per_token: float
-    performance_score: float
-    specialties: List[str]
-
-class ModelGateway:
-    def __init__(self):
-        self.models = self._initialize_models()
-        self.model_cache = {}
-        self.performance_metrics = {}
-    
-    def _initialize_models(self) -> Dict[str, ModelConfig]:
-        """Initialize available AI models"""
-        return {
-            # Medical Reasoning Models
-            "med_palm_2": ModelConfig(
-                name="Med-PaLM 2",
-                endpoint="http://localhost:8001/v1/medical/reasoning",
-                model_type=ModelType.MEDICAL_REASONING,
-                max_tokens=4096,
-                temperature=0.1,
-                cost_per_token=0.002,
-                performance_score=0.95,
-                specialties=["diagnosis", "treatment", "medical_qa"]
-            ),
-            
-            "clinical_bert": ModelConfig(
-                name="ClinicalBERT",
-                endpoint="http://localhost:8002/v1/clinical/analyze",
-                model_type=ModelType.MEDICAL_REASONING,
-                max_tokens=2048,
-                temperature=0.0,
-                cost_per_token=0.001,
-                performance_score=0.88,
-                specialties=["medical_intake", "symptom_analysis"]
-            ),
-            
-            # General Reasoning Models
-            "gpt4_medical": ModelConfig(
-                name="GPT-4 Medical",
-                endpoint="https://api.openai.com/v1/chat/completions",
-                model_type=ModelType.GENERAL_REASONING,
-                max_tokens=8192,
-                temperature=0.2,
-                cost_per_token=0.03,
-                performance_score=0.92,
-                specialties=["complex_reasoning", "medical_qa", "treatment_planning"]
-            ),
-            
-            "claude3_medical": ModelConfig(
-                name="Claude-3 Medical",
-                endpoint="https://api.anthropic.com/v1/messages",
-                model_type=ModelType.GENERAL_REASONING,
-                max_tokens=4096,
-                temperature=0.1,
-                cost_per_token=0.025,
-                performance_score=0.90,
-                specialties=["medical_reasoning", "safety_analysis"]
-            ),
-            
-            # Local Models via Ollama
-            "llama2_medical": ModelConfig(
-                name="Llama2-Medical-7B",
-                endpoint="http://localhost:11434/api/generate",
-                model_type=ModelType.MEDICAL_REASONING,
-                max_tokens=4096,
-                temperature=0.1,
-                cost_per_token=0.0,  # Local model
-                performance_score=0.82,
-                specialties=["medical_intake", "basic_diagnosis"]
-            ),
-            
-            "codellama": ModelConfig(
-                name="CodeLlama-34B",
-                endpoint="http://localhost:11434/api/generate",
-                model_type=ModelType.CODE_GENERATION,
-                max_tokens=4096,
-                temperature=0.1,
-                cost_per_token=0.0,
-                performance_score=0.87,
-                specialties=["code_generation", "medical_software"]
-            )
-        }
-    
-    async def route_request(self, task: str, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Route request to the best model for the task"""
-        try:
-            # Select best model for task
-            model = self._select_best_model(task, data)
-            
-            # Check cache first
-            cache_key = self._generate_cache_key(task, data)
-            if cache_key in self.model_cache:
-                logger.info(f"Cache hit for task: {task}")
-                return self.model_cache[cache_key]
-            
-            # Make request to selected model
-            start_time = time.time()
-            result = await self._make_model_request(model, data)
-            processing_time = time.time() - start_time
-            
-            # Update performance metrics
-            self._update_performance_metrics(model.name, processing_time, result)
-            
-            # Cache result
-            result["model_used"] = model.name
-            result["processing_time"] = processing_time
-            self.model_cache[cache_key] = result
-            
-            return result
-            
-        except Exception as e:
-            logger.error(f"Model routing failed: {str(e)}")
-            return {"error": str(e), "model_used": "none"}
-    
-    def _select_best_model(self, task: str, data: Dict[str, Any]) -> ModelConfig:
-        """Select the best model based on task requirements"""
-        
-        # Task-specific model selection
-        task_model_map = {
-            "medical_intake": ["clinical_bert", "llama2_medical", "med_palm_2"],
-            "medical_reasoning": ["med_palm_2", "gpt4_medical", "claude3_medical"],
-            "medical_qa": ["med_palm_2", "gpt4_medical", "clinical_bert"],
-            "diagnosis": ["med_palm_2", "gpt4_medical", "claude3_medical"],
-            "treatment_planning": ["gpt4_medical", "med_palm_2", "claude3_medical"],
-            "code_generation": ["codellama", "gpt4_medical"],
-            "safety_analysis": ["claude3_medical", "gpt4_medical"]
-        }
-        
-        candidate_models = task_model_map.get(task, ["gpt4_medical"])
-        
-        # Score models based on performance, cost, and availability
-        best_model = None
-        best_score = -1
-        
-        for model_name in candidate_models:
-            if model_name in self.models:
-                model = self.models[model_name]
-                
-                # Calculate composite score
-                performance_weight = 0.4
-                cost_weight = 0.3
-                availability_weight = 0.3
-                
-                performance_score = model.performance_score
-                cost_score = 1.0 - min(model.cost_per_token / 0.05, 1.0)  # Normalize cost
-                availability_score = self._get_availability_score(model_name)
-                
-                composite_score = (
-                    performance_weight * performance_score +
-                    cost_weight * cost_score +
-                    availability_weight * availability_score
-                )
-                
-                if composite_score > best_score:
-                    best_score = composite_score
-                    best_model = model
-        
-        return best_model or self.models["llama2_medical"]  # Fallback
-    
-    async def _make_model_request(self, model: ModelConfig, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Make request to specific model"""
-        
-        if "ollama" in model.endpoint:
-            return await self._make_ollama_request(model, data)
-        elif "openai" in model.endpoint:
-            return await self._make_openai_request(model, data)
-        elif "anthropic" in model.endpoint:
-            return await self._make_anthropic_request(model, data)
-        else:
-            return await self._make_custom_request(model, data)
-    
-    async def _make_ollama_request(self, model: ModelConfig, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Make request to Ollama local model"""
-        try:
-            async with httpx.AsyncClient() as client:
-                payload = {
-                    "model": model.name.lower().replace("-", "_"),
-                    "prompt": data.get("prompt", ""),
-                    "stream": False,
-                    "options": {
-                        "temperature": model.temperature,
-                        "num_predict": model.max_tokens
-                    }
-                }
-                
-                response = await client.post(
-                    model.endpoint,
-                    json=payload,
-                    timeout=60.0
-                )
-                
-                result = response.json()
-                return {
-                    "response": result.get("response", ""),
-                    "model": model.name,
-                    "tokens_used": len(result.get("response", "").split()),
-                    "confidence": 0.85
-                }
-                
-        except Exception as e:
-            logger.error(f"Ollama request failed: {str(e)}")
-            return {"error": str(e)}
-    
-    async def _make_openai_request(self, model: ModelConfig, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Make request to OpenAI API"""
-        try:
-            import openai
-            
-            messages = [
-                {"role": "system", "content": "You are a medical AI assistant."},
-                {"role": "user", "content": data.get("prompt", "")}
-            ]
-            
-            response = await openai.ChatCompletion.acreate(
-                model="gpt-4",
-                messages=messages,
-                temperature=model.temperature,
-                max_tokens=model.max_tokens
-            )
-            
-            return {
-                "response": response.choices[0].message.content,
-                "model": model.name,
-                "tokens_used": response.usage.total_tokens,
-                "confidence": 0.92
-            }
-            
-        except Exception as e:
-            logger.error(f"OpenAI request failed: {str(e)}")
-            return {"error": str(e)}
-    
-    async def _make_anthropic_request(self, model: ModelConfig, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Make request to Anthropic Claude API"""
-        try:
-            import anthropic
-            
-            client = anthropic.AsyncAnthropic()
-            
-            response = await client.messages.create(
-                model="claude-3-sonnet-20240229",
-                max_tokens=model.max_tokens,
-                temperature=model.temperature,
-                messages=[
-                    {"role": "user", "content": data.get("prompt", "")}
-                ]
-            )
-            
-            return {
-                "response": response.content[0].text,
-                "model": model.name,
-                "tokens_used": response.usage.input_tokens + response.usage.output_tokens,
-                "confidence": 0.90
-            }
-            
-        except Exception as e:
-            logger.error(f"Anthropic request failed: {str(e)}")
-            return {"error": str(e)}
-    
-    async def _make_custom_request(self, model: ModelConfig, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Make request to custom model endpoint"""
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    model.endpoint,
-                    json=data,
-                    timeout=60.0
-                )
-                return response.json()
-                
-        except Exception as e:
-            logger.error(f"Custom model request failed: {str(e)}")
-            return {"error": str(e)}
-    
-    def _generate_cache_key(self, task: str, data: Dict[str, Any]) -> str:
-        """Generate cache key for request"""
-        import hashlib
-        content = f"{task}_{json.dumps(data, sort_keys=True)}"
-        return hashlib.md5(content.encode()).hexdigest()
-    
-    def _get_availability_score(self, model_name: str) -> float:
-        """Get model availability score based on recent performance"""
-        if model_name in self.performance_metrics:
-            recent_failures = self.performance_metrics[model_name].get("recent_failures", 0)
-            return max(0.1, 1.0 - (recent_failures * 0.2))
-        return 1.0
-    
-    def _update_performance_metrics(self, model_name: str, processing_time: float, result: Dict[str, Any]):
-        """Update performance metrics for model"""
-        if model_name not in self.performance_metrics:
-            self.performance_metrics[model_name] = {
-                "total_requests": 0,
-                "total_time": 0.0,
-                "recent_failures": 0,
-                "success_rate": 1.0
-            }
-        
-        metrics = self.performance_metrics[model_name]
-        metrics["total_requests"] += 1
-        metrics["total_time"] += processing_time
-        
-        if "error" in result:
-            metrics["recent_failures"] = min(5, metrics["recent_failures"] + 1)
-        else:
-            metrics["recent_failures"] = max(0, metrics["recent_failures"] - 1)
-        
-        metrics["success_rate"] = 1.0 - (metrics["recent_failures"] / 5.0)
-    
-    async def get_available_models(self) -> List[Dict[str, Any]]:
-        """Get list of available models with their capabilities"""
-        models_info = []
-        
-        for name, config in self.models.items():
-            model_info = {
-                "name": config.name,
-                "type": config.model_type.value,
-                "specialties": config.specialties,
-                "performance_score": config.performance_score,
-                "cost_per_token": config.cost_per_token,
-                "availability": self._get_availability_score(name)
-            }
-            models_info.append(model_info)
-        
-        return models_info
-    
-    async def health_check(self) -> Dict[str, Any]:
-        """Check health of all models"""
-        health_status = {}
-        
-        for name, config in self.models.items():
-            try:
-                # Simple health check request
-                test_data = {"prompt": "Health check"}
-                result = await asyncio.wait_for(
-                    self._make_model_request(config, test_data),
-                    timeout=10.0
-                )
-                health_status[name] = "healthy" if "error" not in result else "unhealthy"
-            except:
-                health_status[name] = "unhealthy"
-        
+"""
+Multi-Model Gateway
+Routes requests to the best AI model based on task type and requirements
+"""
+
+import asyncio
+import functools
+import hashlib
+import httpx
+import json
+import numpy as np
+import orjson
+import os
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, List, Any, Mapping, Optional
+import logging
+from dataclasses import dataclass
+from enum import Enum
+from types import MappingProxyType
+import time
+
+try:
+    import openai
+except ImportError:
+    openai = None
+
+try:
+    import anthropic
+except ImportError:
+    anthropic = None
+
+logger = logging.getLogger(__name__)
+
+# Header set for bodies pre-serialized with orjson
+_JSON_HEADERS = {"content-type": "application/json"}
+
+# Keep memoized cache keys to payloads with short scalar values so the
+# lru_cache cannot pin large prompt blobs in memory
+_MEMO_KEY_MAX_STR = 1024
+
+@functools.lru_cache(maxsize=4096)
+def _memoized_cache_key(task: str, items: tuple) -> bytes:
+    """Digest for small flat payloads, memoized on their canonical items.
+
+    items entries are (key, type_name, value): lru_cache compares by
+    equality, and True == 1 == 1.0 even though their serializations
+    differ, so the type name keeps such payloads from colliding.
+    """
+    content = task.encode() + b"\0" + orjson.dumps(
+        {k: v for k, _, v in items}, option=orjson.OPT_SORT_KEYS
+    )
+    return hashlib.blake2b(content, digest_size=16).digest()
+
+class ModelType(Enum):
+    MEDICAL_REASONING = "medical_reasoning"
+    CODE_GENERATION = "code_generation"
+    GENERAL_REASONING = "general_reasoning"
+    MEDICAL_QA = "medical_qa"
+    MEDICAL_INTAKE = "medical_intake"
+
+# Candidate models per task, in preference order
+TASK_MODEL_MAP: Dict[str, tuple] = {
+    "medical_intake": ("clinical_bert", "llama2_medical", "med_palm_2"),
+    "medical_reasoning": ("med_palm_2", "gpt4_medical", "claude3_medical"),
+    "medical_qa": ("med_palm_2", "gpt4_medical", "clinical_bert"),
+    "diagnosis": ("med_palm_2", "gpt4_medical", "claude3_medical"),
+    "treatment_planning": ("gpt4_medical", "med_palm_2", "claude3_medical"),
+    "code_generation": ("codellama", "gpt4_medical"),
+    "safety_analysis": ("claude3_medical", "gpt4_medical")
+}
+
+@dataclass(slots=True, frozen=True)
+class ModelConfig:
+    name: str
+    endpoint: str
+    model_type: ModelType
+    max_tokens: int
+    temperature: float
+    cost_per_token: float
+    performance_score: float
+    specialties: List[str]
+    # Maximum in-flight requests to this backend; keeps one slow model
+    # from occupying every connection-pool slot
+    max_concurrency: int = 16
+
+@dataclass(slots=True)
+class ModelResult:
+    """Outcome of one backend call.
+
+    Stays typed through the metrics path — checking result.error is a
+    slot read, not a dict probe — and is converted to a response dict
+    only at the route_request boundary.
+    """
+    response: str = ""
+    model: str = ""
+    tokens_used: int = 0
+    confidence: float = 0.0
+    error: Optional[str] = None
+    # Raw body from custom endpoints, passed through untouched
+    payload: Optional[Dict[str, Any]] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Serialize for caching and the HTTP response"""
+        if self.error is not None:
+            return {"error": self.error}
+        if self.payload is not None:
+            return dict(self.payload)
+        return {
+            "response": self.response,
+            "model": self.model,
+            "tokens_used": self.tokens_used,
+            "confidence": self.confidence
+        }
+
+# Model configs are fully static, so build them once at import and freeze
+# the mapping; every gateway instance shares the same immutable configs
+MODEL_CONFIGS: Mapping[str, ModelConfig] = MappingProxyType({
+    # Medical Reasoning Models
+    "med_palm_2": ModelConfig(
+        name="Med-PaLM 2",
+        endpoint="http://localhost:8001/v1/medical/reasoning",
+        model_type=ModelType.MEDICAL_REASONING,
+        max_tokens=4096,
+        temperature=0.1,
+        cost_per_token=0.002,
+        performance_score=0.95,
+        specialties=["diagnosis", "treatment", "medical_qa"]
+    ),
+
+    "clinical_bert": ModelConfig(
+        name="ClinicalBERT",
+        endpoint="http://localhost:8002/v1/clinical/analyze",
+        model_type=ModelType.MEDICAL_REASONING,
+        max_tokens=2048,
+        temperature=0.0,
+        cost_per_token=0.001,
+        performance_score=0.88,
+        specialties=["medical_intake", "symptom_analysis"]
+    ),
+
+    # General Reasoning Models
+    "gpt4_medical": ModelConfig(
+        name="GPT-4 Medical",
+        endpoint="https://api.openai.com/v1/chat/completions",
+        model_type=ModelType.GENERAL_REASONING,
+        max_tokens=8192,
+        temperature=0.2,
+        cost_per_token=0.03,
+        performance_score=0.92,
+        specialties=["complex_reasoning", "medical_qa", "treatment_planning"],
+        max_concurrency=32
+    ),
+
+    "claude3_medical": ModelConfig(
+        name="Claude-3 Medical",
+        endpoint="https://api.anthropic.com/v1/messages",
+        model_type=ModelType.GENERAL_REASONING,
+        max_tokens=4096,
+        temperature=0.1,
+        cost_per_token=0.025,
+        performance_score=0.90,
+        specialties=["medical_reasoning", "safety_analysis"],
+        max_concurrency=32
+    ),
+
+    # Local Models via Ollama
+    "llama2_medical": ModelConfig(
+        name="Llama2-Medical-7B",
+        endpoint="http://localhost:11434/api/generate",
+        model_type=ModelType.MEDICAL_REASONING,
+        max_tokens=4096,
+        temperature=0.1,
+        cost_per_token=0.0,  # Local model
+        performance_score=0.82,
+        specialties=["medical_intake", "basic_diagnosis"],
+        max_concurrency=4
+    ),
+
+    "codellama": ModelConfig(
+        name="CodeLlama-34B",
+        endpoint="http://localhost:11434/api/generate",
+        model_type=ModelType.CODE_GENERATION,
+        max_tokens=4096,
+        temperature=0.1,
+        cost_per_token=0.0,
+        performance_score=0.87,
+        specialties=["code_generation", "medical_software"],
+        max_concurrency=4
+    )
+})
+
+class ModelGateway:
+    # Maximum number of cached model responses kept in memory
+    CACHE_MAX_SIZE = 10_000
+
+    # Semantic cache: rephrased prompts hit even when the exact-key cache
+    # misses; capped small so the cosine scan stays trivial
+    SEMANTIC_CACHE_SIZE = 512
+    SEMANTIC_CACHE_THRESHOLD = 0.92
+    EMBEDDING_ENDPOINT = "http://localhost:11434/api/embeddings"
+    EMBEDDING_MODEL = "nomic-embed-text"
+
+    # When every candidate's latency EWMA is under this threshold, latency
+    # is not the bottleneck, so scoring shifts weight from performance to
+    # cost; COST_AWARE_COEF is the cost weight used on that fast path
+    FAST_LATENCY_THRESHOLD = 2.0
+    COST_AWARE_COEF = float(os.environ.get("COST_AWARE_COEF", "0.5"))
+
+    def __init__(self):
+        self.models = self._initialize_models()
+        # Stable integer id per model so selection runs on parallel arrays
+        self._model_ids = {name: i for i, name in enumerate(self.models)}
+        self._model_by_id = tuple(self.models.values())
+        # Performance and cost terms of the composite score never change;
+        # kept as separate vectors because the scoring weights are dynamic
+        self._perf = np.array([cfg.performance_score for cfg in self.models.values()])
+        self._cost_score = np.array([1.0 - min(cfg.cost_per_token / 0.05, 1.0)
+                                     for cfg in self.models.values()])
+        # Availability per model id comes from a 20-bit ring of recent
+        # outcome bits (seeded all-success); latency is an EWMA starting
+        # at 0 so untried models count as fast
+        self._avail = np.ones(len(self.models))
+        self._outcome_mask = [0xFFFFF] * len(self.models)
+        self._latency_ewma = np.zeros(len(self.models))
+        # Candidate id vectors per task, merged with a reverse index over
+        # ModelConfig.specialties so a task that only matches a specialty
+        # still resolves with one dict lookup
+        self._task_candidates = {
+            task: np.array([self._model_ids[n] for n in names
+                            if n in self._model_ids], dtype=np.intp)
+            for task, names in TASK_MODEL_MAP.items()
+        }
+        spec_ids: Dict[str, List[int]] = {}
+        for name, cfg in self.models.items():
+            for specialty in cfg.specialties:
+                spec_ids.setdefault(specialty, []).append(self._model_ids[name])
+        for specialty, ids in spec_ids.items():
+            self._task_candidates.setdefault(
+                specialty, np.array(ids, dtype=np.intp)
+            )
+        self._default_candidates = np.array(
+            [self._model_ids["gpt4_medical"]], dtype=np.intp
+        )
+        # Strict LRU: hits move to the end, overflow evicts the front
+        self.model_cache: OrderedDict = OrderedDict()
+        # Opt-in semantic cache over prompt embeddings; requires the
+        # embedding model to be pulled into the local Ollama instance
+        self._semantic_cache_enabled = os.environ.get(
+            "SEMANTIC_CACHE", ""
+        ).lower() in ("1", "true", "yes")
+        self._sem_embeddings = np.empty((0, 0), dtype=np.float32)
+        self._sem_tasks: List[str] = []
+        self._sem_results: List[Dict[str, Any]] = []
+        self.performance_metrics = {}
+        # Per-model concurrency caps; a saturated backend queues its own
+        # callers instead of exhausting the shared connection pool
+        self._sem = {cfg.name: asyncio.Semaphore(cfg.max_concurrency)
+                     for cfg in self.models.values()}
+        # One pooled client shared by every model backend; HTTP/2 lets
+        # concurrent calls to the same API host multiplex one connection
+        self._client = httpx.AsyncClient(
+            timeout=60.0,
+            limits=httpx.Limits(max_keepalive_connections=64, max_connections=256),
+            http2=True
+        )
+
+        # SDK clients are built once at startup so failures surface eagerly
+        # rather than on the first patient request
+        self._anthropic = None
+        if anthropic is not None:
+            try:
+                self._anthropic = anthropic.AsyncAnthropic()
+            except Exception as e:
+                logger.warning("Anthropic client unavailable: %s", e)
+        # The v1 SDK client reuses the pooled httpx client above, so
+        # OpenAI calls share connections instead of handshaking per call
+        self._openai = None
+        if openai is not None:
+            try:
+                self._openai = openai.AsyncOpenAI(http_client=self._client)
+            except Exception as e:
+                logger.warning("OpenAI client unavailable: %s", e)
+
+    async def aclose(self):
+        """Close the pooled HTTP client; call from app shutdown"""
+        await self._client.aclose()
+    
+    def _initialize_models(self) -> Mapping[str, ModelConfig]:
+        """Initialize available AI models"""
+        return MODEL_CONFIGS
+
+
+    async def route_request(self, task: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Route request to the best model for the task"""
+        model = None
+        start_time = time.time()
+        try:
+            # Select best model for task
+            model = self._select_best_model(task, data)
+
+            # Check cache first; key generation is C-level orjson + BLAKE2b,
+            # cheap enough to run inline even for large QA payloads
+            cache_key = self._generate_cache_key(task, data)
+            cached = self.model_cache.get(cache_key)
+            if cached is not None:
+                self.model_cache.move_to_end(cache_key)
+                logger.debug("Cache hit for task: %s", task)
+                return cached
+
+            # Semantic cache: rephrased prompts can reuse a result the
+            # exact-key lookup above just missed
+            query_embedding = None
+            prompt = data.get("prompt")
+            if self._semantic_cache_enabled and isinstance(prompt, str) and prompt:
+                query_embedding = await self._embed_prompt(prompt)
+                if query_embedding is not None:
+                    cached = self._semantic_cache_get(task, query_embedding)
+                    if cached is not None:
+                        logger.debug("Semantic cache hit for task: %s", task)
+                        return cached
+
+            # Make request to selected model
+            start_time = time.time()  # exclude cache/embedding work
+            result = await self._make_model_request(model, data)
+            processing_time = time.time() - start_time
+
+            # Update performance metrics
+            self._update_performance_metrics(model.name, processing_time, result)
+
+            # Serialize to a dict only here, at the boundary. Failures are
+            # never cached: neither cache has a TTL, so a transient backend
+            # outage would otherwise be served until eviction
+            response = result.as_dict()
+            response["model_used"] = model.name
+            response["processing_time"] = processing_time
+            if result.error is None:
+                self.model_cache[cache_key] = response
+                if len(self.model_cache) > self.CACHE_MAX_SIZE:
+                    self.model_cache.popitem(last=False)
+                if query_embedding is not None:
+                    self._semantic_cache_put(task, query_embedding, response)
+
+            return response
+            
+        except Exception as e:
+            logger.error("Model routing failed: %s", e)
+            # Count the failure against the chosen model so selection
+            # routes around a saturated or timing-out backend
+            if model is not None:
+                self._update_performance_metrics(
+                    model.name, time.time() - start_time, ModelResult(error=str(e))
+                )
+            return {"error": str(e), "model_used": "none"}
+    
+    def _select_best_model(self, task: str, data: Dict[str, Any]) -> ModelConfig:
+        """Select the best model based on task requirements"""
+        idx = self._task_candidates.get(task, self._default_candidates)
+        if idx.size == 0:
+            return self.models["llama2_medical"]  # Fallback
+
+        # When the whole candidate set is responding fast, quality routing
+        # buys little, so shift weight from performance onto cost
+        if bool((self._latency_ewma[idx] < self.FAST_LATENCY_THRESHOLD).all()):
+            wp, wc, wa = 0.2, self.COST_AWARE_COEF, 0.3
+        else:
+            wp, wc, wa = 0.4, 0.3, 0.3
+
+        scores = wp * self._perf[idx] + wc * self._cost_score[idx] + wa * self._avail[idx]
+        return self._model_by_id[idx[int(scores.argmax())]]
+    
+    async def route_request_stream(self, task: str, data: Dict[str, Any]) -> AsyncIterator[str]:
+        """Stream the best model's response text as the provider emits it.
+
+        Bypasses the caches: streaming callers are optimizing for
+        first-token latency, and partial responses are not cacheable.
+        """
+        model = self._select_best_model(task, data)
+        start_time = time.time()
+        error = None
+        try:
+            # Streams count against the same per-model cap as buffered
+            # requests; the slot is held until the stream finishes
+            async with self._sem[model.name]:
+                if "ollama" in model.endpoint:
+                    async for chunk in self._stream_ollama(model, data):
+                        yield chunk
+                elif "openai" in model.endpoint:
+                    async for chunk in self._stream_openai(model, data):
+                        yield chunk
+                elif "anthropic" in model.endpoint:
+                    async for chunk in self._stream_anthropic(model, data):
+                        yield chunk
+                else:
+                    # Custom endpoints have no streaming contract; fall back
+                    # to one buffered request
+                    result = await self._make_custom_request(model, data)
+                    if result.error is not None:
+                        error = result.error
+                    else:
+                        yield str(result.as_dict().get("response", ""))
+        except Exception as e:
+            error = str(e)
+            logger.error("Streaming request failed: %s", e)
+        finally:
+            self._update_performance_metrics(
+                model.name, time.time() - start_time,
+                ModelResult() if error is None else ModelResult(error=error)
+            )
+
+    async def _stream_ollama(self, model: ModelConfig, data: Dict[str, Any]) -> AsyncIterator[str]:
+        """Stream ndjson chunks from an Ollama model"""
+        payload = {
+            "model": model.name.lower().replace("-", "_"),
+            "prompt": data.get("prompt", ""),
+            "stream": True,
+            "options": {
+                "temperature": model.temperature,
+                "num_predict": model.max_tokens
+            }
+        }
+        async with self._client.stream(
+            "POST", model.endpoint,
+            content=orjson.dumps(payload),
+            headers=_JSON_HEADERS,
+            timeout=60.0
+        ) as response:
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                chunk = orjson.loads(line)
+                text = chunk.get("response")
+                if text:
+                    yield text
+                if chunk.get("done"):
+                    break
+
+    async def _stream_openai(self, model: ModelConfig, data: Dict[str, Any]) -> AsyncIterator[str]:
+        """Stream completion deltas from the OpenAI API"""
+        if self._openai is None:
+            raise RuntimeError("OpenAI client unavailable")
+        stream = await self._openai.chat.completions.create(
+            model="gpt-4",
+            messages=[
+                {"role": "system", "content": "You are a medical AI assistant."},
+                {"role": "user", "content": data.get("prompt", "")}
+            ],
+            temperature=model.temperature,
+            max_tokens=model.max_tokens,
+            stream=True
+        )
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                yield delta
+
+    async def _stream_anthropic(self, model: ModelConfig, data: Dict[str, Any]) -> AsyncIterator[str]:
+        """Stream text deltas from the Anthropic API"""
+        if self._anthropic is None:
+            raise RuntimeError("Anthropic client unavailable")
+        async with self._anthropic.messages.stream(
+            model="claude-3-sonnet-20240229",
+            max_tokens=model.max_tokens,
+            temperature=model.temperature,
+            messages=[
+                {"role": "user", "content": data.get("prompt", "")}
+            ]
+        ) as stream:
+            async for text in stream.text_stream:
+                yield text
+
+    async def _make_model_request(self, model: ModelConfig, data: Dict[str, Any],
+                                  timeout: float = 60.0) -> ModelResult:
+        """Make request to specific model"""
+
+        # The deadline covers the semaphore queue wait as well as the HTTP
+        # call, so a saturated backend cannot stall short-deadline callers
+        # (health probes) for a full request lifetime waiting on a slot
+        try:
+            async with asyncio.timeout(timeout):
+                async with self._sem[model.name]:
+                    if "ollama" in model.endpoint:
+                        return await self._make_ollama_request(model, data, timeout)
+                    elif "openai" in model.endpoint:
+                        return await self._make_openai_request(model, data, timeout)
+                    elif "anthropic" in model.endpoint:
+                        return await self._make_anthropic_request(model, data, timeout)
+                    else:
+                        return await self._make_custom_request(model, data, timeout)
+        except asyncio.TimeoutError:
+            logger.error("%s request timed out after %.1fs including queue wait",
+                         model.name, timeout)
+            return ModelResult(error=f"timed out after {timeout}s")
+    
+    async def _make_ollama_request(self, model: ModelConfig, data: Dict[str, Any],
+                                   timeout: float = 60.0) -> ModelResult:
+        """Make request to Ollama local model"""
+        try:
+            payload = {
+                "model": model.name.lower().replace("-", "_"),
+                "prompt": data.get("prompt", ""),
+                "stream": False,
+                "options": {
+                    "temperature": model.temperature,
+                    "num_predict": model.max_tokens
+                }
+            }
+
+            # orjson both ways keeps serialization C-level; bodies carry
+            # the full prompt text so this runs on every call
+            response = await self._client.post(
+                model.endpoint,
+                content=orjson.dumps(payload),
+                headers=_JSON_HEADERS,
+                timeout=timeout
+            )
+
+            result = orjson.loads(response.content)
+            text = result.get("response", "")
+            # Prefer the server's exact token count; fall back to the
+            # ~4-chars-per-token heuristic instead of splitting the text
+            tokens_used = result.get("eval_count") or (len(text) >> 2) or 1
+            return ModelResult(
+                response=text,
+                model=model.name,
+                tokens_used=tokens_used,
+                confidence=0.85
+            )
+
+        except (asyncio.TimeoutError, httpx.HTTPError, orjson.JSONDecodeError) as e:
+            logger.error("Ollama request failed: %s", e)
+            return ModelResult(error=str(e))
+    
+    async def _make_openai_request(self, model: ModelConfig, data: Dict[str, Any],
+                                   timeout: float = 60.0) -> ModelResult:
+        """Make request to OpenAI API"""
+        try:
+            if self._openai is None:
+                raise RuntimeError("OpenAI client unavailable")
+
+            messages = [
+                {"role": "system", "content": "You are a medical AI assistant."},
+                {"role": "user", "content": data.get("prompt", "")}
+            ]
+
+            response = await self._openai.chat.completions.create(
+                model="gpt-4",
+                messages=messages,
+                temperature=model.temperature,
+                max_tokens=model.max_tokens,
+                timeout=timeout
+            )
+            
+            return ModelResult(
+                response=response.choices[0].message.content,
+                model=model.name,
+                tokens_used=response.usage.total_tokens,
+                confidence=0.92
+            )
+
+        except Exception as e:
+            logger.error("OpenAI request failed: %s", e)
+            return ModelResult(error=str(e))
+    
+    async def _make_anthropic_request(self, model: ModelConfig, data: Dict[str, Any],
+                                      timeout: float = 60.0) -> ModelResult:
+        """Make request to Anthropic Claude API"""
+        try:
+            if self._anthropic is None:
+                raise RuntimeError("Anthropic client unavailable")
+
+            response = await self._anthropic.messages.create(
+                model="claude-3-sonnet-20240229",
+                max_tokens=model.max_tokens,
+                temperature=model.temperature,
+                messages=[
+                    {"role": "user", "content": data.get("prompt", "")}
+                ],
+                timeout=timeout
+            )
+            
+            return ModelResult(
+                response=response.content[0].text,
+                model=model.name,
+                tokens_used=response.usage.input_tokens + response.usage.output_tokens,
+                confidence=0.90
+            )
+
+        except Exception as e:
+            logger.error("Anthropic request failed: %s", e)
+            return ModelResult(error=str(e))
+    
+    async def _make_custom_request(self, model: ModelConfig, data: Dict[str, Any],
+                                   timeout: float = 60.0) -> ModelResult:
+        """Make request to custom model endpoint"""
+        try:
+            # default=dict unwraps the read-only patient_data mapping view
+            response = await self._client.post(
+                model.endpoint,
+                content=orjson.dumps(data, default=dict),
+                headers=_JSON_HEADERS,
+                timeout=timeout
+            )
+            payload = orjson.loads(response.content)
+            return ModelResult(model=model.name, payload=payload,
+                               error=payload.get("error"))
+
+        except (asyncio.TimeoutError, httpx.HTTPError, orjson.JSONDecodeError) as e:
+            logger.error("Custom model request failed: %s", e)
+            return ModelResult(error=str(e))
+    
+    async def _embed_prompt(self, prompt: str) -> Optional[np.ndarray]:
+        """Embed a prompt via the local Ollama embedding model"""
+        try:
+            response = await self._client.post(
+                self.EMBEDDING_ENDPOINT,
+                content=orjson.dumps({"model": self.EMBEDDING_MODEL, "prompt": prompt}),
+                headers=_JSON_HEADERS,
+                timeout=10.0
+            )
+            vec = np.asarray(orjson.loads(response.content).get("embedding", ()),
+                             dtype=np.float32)
+            if vec.size == 0:
+                return None
+            norm = np.linalg.norm(vec)
+            return vec / norm if norm else None
+        except Exception as e:
+            logger.debug("Prompt embedding failed: %s", e)
+            return None
+
+    def _semantic_cache_get(self, task: str, query: np.ndarray) -> Optional[Dict[str, Any]]:
+        """Return the cached same-task result most similar to the query"""
+        if self._sem_embeddings.shape[0] == 0:
+            return None
+        if query.size != self._sem_embeddings.shape[1]:
+            return None  # embedding model changed mid-run; treat as a miss
+        sims = self._sem_embeddings @ query
+        # Entries from other tasks are ineligible: a similar prompt routed
+        # under a different task must not reuse this task's response
+        sims = np.where(
+            np.fromiter((t == task for t in self._sem_tasks),
+                        dtype=bool, count=len(self._sem_tasks)),
+            sims, -1.0
+        )
+        i = int(sims.argmax())
+        if sims[i] < self.SEMANTIC_CACHE_THRESHOLD:
+            return None
+        # Move the hit to the end so eviction drops the least recently used
+        if i != self._sem_embeddings.shape[0] - 1:
+            hit = self._sem_embeddings[i]
+            self._sem_embeddings = np.vstack(
+                (np.delete(self._sem_embeddings, i, axis=0), hit)
+            )
+            self._sem_tasks.append(self._sem_tasks.pop(i))
+            self._sem_results.append(self._sem_results.pop(i))
+        return self._sem_results[-1]
+
+    def _semantic_cache_put(self, task: str, query: np.ndarray, result: Dict[str, Any]):
+        """Store an embedding/result pair, evicting the oldest entry when full"""
+        if self._sem_embeddings.shape[0] == 0:
+            self._sem_embeddings = query.reshape(1, -1)
+        elif query.size != self._sem_embeddings.shape[1]:
+            return  # embedding model changed mid-run; skip rather than corrupt
+        else:
+            self._sem_embeddings = np.vstack((self._sem_embeddings, query))
+        self._sem_tasks.append(task)
+        self._sem_results.append(result)
+        if len(self._sem_results) > self.SEMANTIC_CACHE_SIZE:
+            self._sem_embeddings = np.delete(self._sem_embeddings, 0, axis=0)
+            self._sem_tasks.pop(0)
+            self._sem_results.pop(0)
+
+    def _generate_cache_key(self, task: str, data: Dict[str, Any]) -> bytes:
+        """Generate cache key for request"""
+        # Small flat payloads (retries, polling) are memoized so repeats
+        # skip re-serialization and hashing entirely
+        if len(data) <= 8:
+            if all(isinstance(v, (str, int, float, bool, type(None))) and
+                   (not isinstance(v, str) or len(v) <= _MEMO_KEY_MAX_STR)
+                   for v in data.values()):
+                items = tuple((k, type(v).__name__, v)
+                              for k, v in sorted(data.items()))
+                return _memoized_cache_key(task, items)
+
+        # default=dict unwraps the read-only patient_data mapping view
+        content = task.encode() + b"\0" + orjson.dumps(
+            data, option=orjson.OPT_SORT_KEYS, default=dict
+        )
+        # Raw 16-byte digest: BLAKE2b beats MD5 and halves key memory vs hex
+        return hashlib.blake2b(content, digest_size=16).digest()
+    
+    def _get_availability_score(self, model_name: str) -> float:
+        """Get model availability score based on recent performance"""
+        model_id = self._model_ids.get(model_name)
+        return float(self._avail[model_id]) if model_id is not None else 1.0
+    
+    def _update_performance_metrics(self, model_name: str, processing_time: float, result: ModelResult):
+        """Update performance metrics for model"""
+        if model_name not in self.performance_metrics:
+            self.performance_metrics[model_name] = {
+                "total_requests": 0,
+                "total_time": 0.0
+            }
+
+        metrics = self.performance_metrics[model_name]
+        metrics["total_requests"] += 1
+        metrics["total_time"] += processing_time
+
+        model_id = self._model_ids.get(model_name)
+        if model_id is not None:
+            # Shift the newest outcome bit into a 20-call window; popcount
+            # over the mask is the true recent success ratio, so a model
+            # that recovered stops being penalized within 20 calls
+            bit = 0 if result.error is not None else 1
+            mask = ((self._outcome_mask[model_id] << 1) | bit) & 0xFFFFF
+            self._outcome_mask[model_id] = mask
+            self._avail[model_id] = mask.bit_count() / 20.0
+            # Latency EWMA feeds the fast-tier weight switch in
+            # _select_best_model; seed with the first observation
+            if metrics["total_requests"] == 1:
+                self._latency_ewma[model_id] = processing_time
+            else:
+                self._latency_ewma[model_id] = (
+                    0.9 * self._latency_ewma[model_id] + 0.1 * processing_time
+                )
+    
+    async def get_available_models(self) -> List[Dict[str, Any]]:
+        """Get list of available models with their capabilities"""
+        models_info = []
+        
+        for name, config in self.models.items():
+            model_info = {
+                "name": config.name,
+                "type": config.model_type.value,
+                "specialties": config.specialties,
+                "performance_score": config.performance_score,
+                "cost_per_token": config.cost_per_token,
+                "availability": self._get_availability_score(name)
+            }
+            models_info.append(model_info)
+        
+        return models_info
+    
+    async def health_check(self) -> Dict[str, Any]:
+        """Check health of all models concurrently"""
+        test_data = {"prompt": "Health check"}
+        # One 10s deadline per probe, covering both the concurrency-slot
+        # wait and the request itself; no wait_for wrapper, so probes
+        # cancel cleanly on shutdown
+        tasks = [
+            self._make_model_request(config, test_data, timeout=10.0)
+            for config in self.models.values()
+        ]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        health_status = {}
+        for name, result in zip(self.models.keys(), results):
+            healthy = isinstance(result, ModelResult) and result.error is None
+            health_status[name] = "healthy" if healthy else "unhealthy"
+
         return health_status
\ No newline at end of file
@@ -0,0 +1,50 @@
+"""
+Shared HTTP Session
+Process-wide aiohttp.ClientSession so all agents and endpoints reuse one connection pool
+"""
+
+import aiohttp
+import logging
+from types import MappingProxyType
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Header set for bodies pre-serialized with orjson
+JSON_HEADERS = {"content-type": "application/json"}
+
+def orjson_default(obj):
+    """Serialize the read-only patient_data view orjson does not know"""
+    if isinstance(obj, MappingProxyType):
+        return dict(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+_session: Optional[aiohttp.ClientSession] = None
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Get the process-wide HTTP session, creating it on first use.
+
+    Must be called with a running event loop; all call sites are
+    coroutines or the FastAPI lifespan handler.
+    """
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=200,
+                limit_per_host=50,
+                keepalive_timeout=30,
+                ttl_dns_cache=300
+            ),
+            timeout=aiohttp.ClientTimeout(total=30)
+        )
+        logger.info("Shared HTTP session initialized")
+    return _session
+
+async def close_http_session():
+    """Close the shared HTTP session and release pooled connections"""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+        _session = None
+        logger.info("Shared HTTP session closed")